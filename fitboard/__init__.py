@@ -5,6 +5,9 @@ Dash as a rout into it.
 See: https://flask.palletsprojects.com/en/1.1.x/patterns/appfactories/
 """
 
+import logging
+import os
+
 from flask import Flask
 
 
@@ -13,6 +16,11 @@ __version__ = '0.1.0'
 
 def init_app():
     """Construct core Flask application."""
+    # Set FITBOARD_DEBUG=1 for the debug output of the dashboard
+    logging.basicConfig(
+        level=(logging.DEBUG if os.environ.get("FITBOARD_DEBUG") == "1"
+               else logging.WARNING))
+
     app = Flask(__name__, instance_relative_config=False)
 
     with app.app_context():
@@ -0,0 +1,151 @@
+/*
+Clientside callbacks for the dashboard. Dash serves all files in the `assets`
+folder automatically, the functions are registered in `dashboard.py` via
+`ClientsideFunction(namespace="fitboard", ...)`.
+*/
+
+// Plotly may send numpy arrays as base64 encoded typed arrays
+var TYPED_ARRAYS = {
+    "f8": Float64Array, "f4": Float32Array,
+    "i4": Int32Array, "i2": Int16Array, "i1": Int8Array,
+    "u4": Uint32Array, "u2": Uint16Array, "u1": Uint8Array,
+};
+
+function toArray(arr) {
+    if (arr && arr.bdata !== undefined) {
+        var raw = atob(arr.bdata);
+        var bytes = new Uint8Array(raw.length);
+        for (var i = 0; i < raw.length; i++) {
+            bytes[i] = raw.charCodeAt(i);
+        }
+        return new TYPED_ARRAYS[arr.dtype](bytes.buffer);
+    }
+    return arr;
+}
+
+// Index of the first element in the sorted `arr`, which is larger than `v`
+// or, if `right` is false, larger or equal than `v`.
+function bisect(arr, v, right) {
+    var lo = 0, hi = arr.length;
+    while (lo < hi) {
+        var mid = (lo + hi) >> 1;
+        if (arr[mid] < v || (right && arr[mid] === v)) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo;
+}
+
+// Returns the selected x range from the relayout data, `null` for the full
+// range or `undefined` if the event did not change the x axis.
+function getXRange(relayout) {
+    if (!relayout) {
+        return undefined;
+    }
+    if (relayout["xaxis.autorange"]) {
+        return null;
+    }
+    if (relayout["xaxis.range[0]"] !== undefined) {
+        return [relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]];
+    }
+    if (relayout["xaxis.range"] !== undefined) {
+        return relayout["xaxis.range"];
+    }
+    return undefined;
+}
+
+// Show or hide the mean traces and the title with their values
+function showMeans(fig, plotMeans) {
+    var title = [];
+    var data = fig.data.map(function(trace) {
+        if (trace.meta !== "mean") {
+            return trace;
+        }
+        title.push(trace.name + "=" + trace.y[0].toFixed(1));
+        return Object.assign({}, trace, {visible: plotMeans});
+    });
+    var layout = Object.assign({}, fig.layout, {
+        title: Object.assign({}, fig.layout.title, {
+            text: plotMeans && title.length > 0
+                ? "Mean values: " + title.join(", ") : ""
+        })
+    });
+    return Object.assign({}, fig, {data: data, layout: layout});
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    fitboard: {
+        // Show the stored figure in the selected x range, recompute the mean
+        // values of each trace in that range and show them if selected.
+        apply_xrange: function(fig, relayout, plotMeans, curFig) {
+            if (!fig) {
+                return window.dash_clientside.no_update;
+            }
+            plotMeans = plotMeans ? plotMeans.length > 0 : false;
+            var ctx = window.dash_clientside.callback_context;
+            var triggeredBy = function(prefix) {
+                return ctx.triggered.length > 0 && ctx.triggered.every(
+                    function(t) { return t.prop_id.startsWith(prefix); });
+            };
+            if (triggeredBy("graph_dataset_selector_checklist_mean.")) {
+                // Only toggle the means of the figure as it is shown now
+                return showMeans(curFig || fig, plotMeans);
+            }
+            var xrnge = getXRange(relayout);
+            if (triggeredBy("graph_main_graph.") && xrnge === undefined) {
+                // Eg. y axis zoom, nothing to do for us
+                return window.dash_clientside.no_update;
+            }
+            if (xrnge === undefined) {
+                // New figure from the server, it already uses the last range
+                return showMeans(fig, plotMeans);
+            }
+
+            var out = Object.assign({}, fig);
+            out.layout = Object.assign({}, fig.layout);
+            out.layout.xaxis = Object.assign({}, fig.layout.xaxis);
+            if (xrnge === null) {
+                out.layout.xaxis.range = null;
+                out.layout.xaxis.autorange = true;
+            } else {
+                out.layout.xaxis.range = xrnge;
+                out.layout.xaxis.autorange = false;
+            }
+
+            if (ctx.triggered.some(function(t) {
+                    return t.prop_id.startsWith("graph_main_store."); })) {
+                // The server built the figure for this range, its means are
+                // computed from the full data
+                return showMeans(out, plotMeans);
+            }
+
+            // Each mean trace directly follows its data trace
+            out.data = fig.data.map(function(trace, i) {
+                if (trace.meta !== "mean") {
+                    return trace;
+                }
+                // Mean of the shown points only until the figure rebuilt by
+                // the server for this range arrives in the store
+                var data = fig.data[i - 1];
+                var x = toArray(data.x);
+                var y = toArray(data.y);
+                var j0 = xrnge === null ? 0 : bisect(x, xrnge[0], true);
+                var j1 = xrnge === null ? x.length : bisect(x, xrnge[1], false);
+                if (j1 <= j0) {
+                    return trace;
+                }
+                var sum = 0;
+                for (var j = j0; j < j1; j++) {
+                    sum += y[j];
+                }
+                var mean = sum / (j1 - j0);
+                return Object.assign({}, trace, {
+                    x: [x[j0], x[j1 - 1]], y: [mean, mean]
+                });
+            });
+            return showMeans(out, plotMeans);
+        },
+    },
+});
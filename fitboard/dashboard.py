@@ -5,15 +5,21 @@ For this reason we need to put it all into an init function which is imported
 into the main Flask `init_app` method.
 """
 
+import datetime
+import functools
+import logging
+import numbers
 import os
-from glob import glob
+import threading
 
 import numpy as np
 
 import dash
-from dash.dependencies import Input, Output
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
 from dash import html
+from flask_caching import Cache
 import plotly.graph_objects as go
 
 # Use this for debug mode in this folder via poetry run python dashboard.py
@@ -30,8 +36,8 @@ from .ui_elements import (
     get_ui_card_form_group_graph_data_selector
     )
 
-import fitdecode
 
+log = logging.getLogger(__name__)
 
 # These needs to be replaced with a proper multiuser cache if used for more
 # than one user locally.
@@ -40,11 +46,47 @@ _DFLT_FIT_FILE_PATH = os.path.expanduser(
 # THese are used as globals, OK for a single app user
 _FIT_FILE_LIST = []
 _FIT_FILE_LIST_FILTERED = []
-_FIT_FILE_SIZES = []
-_CUR_FIT_FILES = []
-_CUR_VALUES = {}
-_CUR_UNITS = {}
+# Dropdown options for the lists above, built once per folder scan
+_FIT_FILE_OPTS = []
+_FIT_FILE_OPTS_FILTERED = []
+_CUR_FIT_OPTS = []
 _EMPTY_FIT_SIZE = 584  # In bytes
+_N_PLOT_SAMPLES = 2000  # Max. number of points sent to the browser per trace
+_N_WARM_FILES = 5  # Number of most recent files parsed in the background
+# Plotly axis ids and layout names for the i-th selected data set, one for each
+# of the five data sets selectable in the dashboard
+_AX_IDS = ["y"] + ["y{}".format(i) for i in range(2, 6)]
+_AX_NAMES = ["yaxis"] + ["yaxis{}".format(i) for i in range(2, 6)]
+# Cache for parsed FIT files, bound to the Flask server in `init_dashboard`.
+# On disk, so all server worker processes share the parsed files and they
+# survive restarts
+_CACHE = Cache()
+# One lock per file name, so each file is only parsed once at a time
+_PARSE_LOCKS = {}
+# File names of the last `_warm_cache` call, so page reloads without changes
+# in the folder don't start another warm-up
+_LAST_WARMED = ()
+# A single background thread parses the files of the latest warm-up, older
+# ones still waiting are replaced. The thread is started on first use
+_WARM_COND = threading.Condition()
+_WARM_PENDING = ()
+_WARM_THREAD = None
+# (name, mtime, size) of files which could not be parsed, so they are not
+# parsed again on each warm-up. A changed file gets another try
+_FAILED_FILES = set()
+# Bump whenever the output of `_load_fit_file` changes, so stale cache entries
+# written by older versions are not used anymore. Part of the cache directory,
+# as the file system cache ignores key prefixes
+_PARSE_FORMAT_VERSION = 1
+_CACHE_CONFIG = {
+    "CACHE_TYPE": "FileSystemCache",
+    "CACHE_DIR": os.path.join(
+        os.environ.get("XDG_CACHE_HOME", os.path.expanduser(
+            os.path.join("~", ".cache"))), "fitboard",
+        "v{}".format(_PARSE_FORMAT_VERSION)),
+    "CACHE_DEFAULT_TIMEOUT": 0,
+    "CACHE_THRESHOLD": 32,  # Max. number of cached files
+}
 
 
 def init_dashboard(server):
@@ -57,9 +99,7 @@ def init_dashboard(server):
         # For themes, see https://www.bootstrapcdn.com/bootswatch/
         external_stylesheets=[dbc.themes.MINTY],
     )
-
-    # Get initial list of FIT files from default location
-    _init_fit_file_db(_DFLT_FIT_FILE_PATH)
+    _CACHE.init_app(server, config=_CACHE_CONFIG)
 
     # Build the dashboard layout
     _init_layout(dash_app)
@@ -67,7 +107,7 @@ def init_dashboard(server):
     # Init callbacks on Flask app load, not globally before it is running
     _init_callbacks(dash_app)
 
-    print("Dash app created")
+    log.info("Dash app created")
 
     return dash_app.server
 
@@ -76,39 +116,50 @@ def _init_layout(dash_app):
     """
     Build our HTML layout on the fly using `dash_html_components`.
     """
-    card_path_selector = get_ui_card_form_group_select_folder(
-        "group_select_folder_")
-    card_fit_file_selector = get_ui_card_form_group_select_fit_file(
-        "fit_file_selector_", _CUR_FIT_FILES)
-    card_graph_dataset_selector_ = get_ui_card_form_group_graph_data_selector(
-        "graph_dataset_selector_")
-    card_graph_main = get_ui_graph_main("graph_main_")
-
-    dash_app.layout = dbc.Container(
-        [
-            html.H2("Viewer Board for FIT Data", style={"margin-top": 5}),
-            dbc.Row(
-                [
-                    dbc.Col(card_path_selector),
-                    dbc.Col(card_fit_file_selector),
-                ],
-                style={"margin-top": "10px"}
-            ),
-            dbc.Row(
-                [
-                    dbc.Col(card_graph_dataset_selector_),
-                ],
-                style={"margin-top": "10px"}
-            ),
-            dbc.Row(
-                [
-                    dbc.Col(card_graph_main),
-                ],
-                style={"margin-top": "10px"}
-            ),
-        ],
-        fluid=False,
-    )
+    def _serve_layout():
+        # Called on each page load, so the dropdown already holds the current
+        # files of the default folder and needs no initial callback.
+        # Most recent first, the last one is selected by default
+        _init_fit_file_db(_DFLT_FIT_FILE_PATH)
+        _warm_cache(dash_app.server,
+                    _FIT_FILE_LIST_FILTERED[:-_N_WARM_FILES - 1:-1])
+
+        card_path_selector = get_ui_card_form_group_select_folder(
+            "group_select_folder_")
+        card_fit_file_selector = get_ui_card_form_group_select_fit_file(
+            "fit_file_selector_", *_dropdown_triple(_CUR_FIT_OPTS))
+        card_graph_dataset_selector_ = (
+            get_ui_card_form_group_graph_data_selector(
+                "graph_dataset_selector_"))
+        card_graph_main = get_ui_graph_main("graph_main_")
+
+        return dbc.Container(
+            [
+                html.H2("Viewer Board for FIT Data", style={"margin-top": 5}),
+                dbc.Row(
+                    [
+                        dbc.Col(card_path_selector),
+                        dbc.Col(card_fit_file_selector),
+                    ],
+                    style={"margin-top": "10px"}
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(card_graph_dataset_selector_),
+                    ],
+                    style={"margin-top": "10px"}
+                ),
+                dbc.Row(
+                    [
+                        dbc.Col(card_graph_main),
+                    ],
+                    style={"margin-top": "10px"}
+                ),
+            ],
+            fluid=False,
+        )
+
+    dash_app.layout = _serve_layout
 
 
 def _init_callbacks(dash_app):
@@ -117,33 +168,46 @@ def _init_callbacks(dash_app):
     """
     # Callback for all main graph controls.
     # Note: You can only have one callback output for each element globally, so
-    # all functionality altering the graph must be in this callback here.
-    # Note: The relayout data input has the drawback, that the interactive
-    # scaling on the y axis is now not working anymore, don't really know why.
+    # the full figure is built here and stored in the browser. Pan and zoom only
+    # need a new x range and mean values, which the clientside callback below
+    # computes from the stored figure without a trip to the server. The mean
+    # lines are always included and only shown or hidden there. A new x range
+    # also gets a figure with the full detail in that range from here.
     @dash_app.callback(
         [Output("fit_file_selector_div", "children"),
-         Output("graph_main_graph", "figure"),
+         Output("graph_main_store", "data"),
          Output("graph_main_alert", "children"),
          Output("graph_main_div_graph", "style"),
          Output("graph_main_div_alert", "style"),
          Output("graph_dataset_selector_div", "children")],
         [Input("fit_file_selector_dropdown", "value"),
          Input("graph_dataset_selector_checklist", "value"),
-         Input("graph_dataset_selector_checklist_mean", "value"),
          Input("graph_main_graph", "relayoutData")])
-    def cb_fig_control(dropdown_val, ynames, plot_means, clickdata):
+    def cb_fig_control(dropdown_val, ynames, clickdata):
         # Read data from selected file, make figure.
         # If err, display the error instead
-        print("In cb_dropdown_dataset")
-        print("  - dopdown val is: {}".format(dropdown_val))
-        print("  - switch vals are: {}".format(ynames))
+        log.debug("In cb_dropdown_dataset")
+        # Only zoom or pan in x needs new data, eg. y zoom or autosize not
+        triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+        if (triggered == ["graph_main_graph.relayoutData"] and
+                not any(k.startswith("xaxis.") for k in clickdata or {})):
+            raise PreventUpdate
+        log.debug("  - dopdown val is: %s", dropdown_val)
+        log.debug("  - switch vals are: %s", ynames)
         ga_text = ""
         dg_style = {"display": "block"}
         dga_style = {"display": "none"}
         try:
-            global _CUR_VALUES, _CUR_UNITS
-            _CUR_VALUES, _CUR_UNITS = _load_fit_file(dropdown_val)
-            plot_means = True if plot_means else False  # List to bool convers.
+            mtime_ns, size = None, None
+            if dropdown_val is not None:
+                # Only parse again, if another or a changed file is selected
+                try:
+                    st = os.stat(dropdown_val)
+                except OSError:
+                    # Same message as from `_load_fit_file`
+                    raise IOError(
+                        "No FIT file found at {}".format(dropdown_val))
+                mtime_ns, size = st.st_mtime_ns, st.st_size
             try:
                 xrnge = [
                     clickdata["xaxis.range[0]"],
@@ -151,21 +215,31 @@ def _init_callbacks(dash_app):
                 ]
             except (KeyError, TypeError):
                 xrnge = [None, None]
-            print("xrnge : ", xrnge)
-            fig = _make_figure(
-                _CUR_VALUES, _CUR_UNITS,
-                ynames=ynames, xrnge=xrnge, plot_means=plot_means)
+            log.debug("xrnge : %s", xrnge)
+            fig = _make_figure_cached(
+                dropdown_val, mtime_ns, size,
+                tuple(ynames), tuple(xrnge))
         except IOError as err:
             fig = go.Figure()  # Dummy, will be hidden anyway
             ga_text = str(err)
-            # Switch visibility
-            dg_style, dga_style = dga_style, dg_style
-            dga_style["margin"] = "auto"
+            # Hide the graph and show the error instead
+            dg_style = {"display": "none"}
+            dga_style = {"display": "block", "margin": "auto"}
 
         # The feedback message under the dropdown
         msg = ("Selected '{}'".format(dropdown_val)
-               if dropdown_val is not None else "No dataset selected",)
-        return msg, fig, ga_text, dg_style, dga_style, (", ".join(ynames),)
+               if dropdown_val is not None else "No dataset selected")
+        return msg, fig, ga_text, dg_style, dga_style, ", ".join(ynames)
+
+    # Apply pan and zoom in the browser and update the mean values for the new
+    # x range, toggling the means needs no new figure, see `assets/fitboard.js`
+    dash_app.clientside_callback(
+        ClientsideFunction(namespace="fitboard", function_name="apply_xrange"),
+        Output("graph_main_graph", "figure"),
+        [Input("graph_main_store", "data"),
+         Input("graph_main_graph", "relayoutData"),
+         Input("graph_dataset_selector_checklist_mean", "value")],
+        [State("graph_main_graph", "figure")])
 
     @dash_app.callback(
         [Output("fit_file_selector_dropdown", "options"),
@@ -176,21 +250,27 @@ def _init_callbacks(dash_app):
          Output("group_select_folder_alert", "children")],
         [Input("group_select_folder_radio_items", "value"),
          Input("group_select_folder_input", "value"),
-         Input("fit_file_selector_checklist", "value")])
+         Input("fit_file_selector_checklist", "value")],
+        # The layout is built with the default folder's files already
+        prevent_initial_call=True)
     def cb_fit_file_selection(radio_val, custom_file_path, switch_val):
-        print("In cb_fit_file_selection")
-        print("  - radio_val is: {}".format(radio_val))
-        print("  - custom_file_path is: {}".format(custom_file_path))
-        print("  - switch_val is: {}".format(switch_val))
+        log.debug("In cb_fit_file_selection")
+        log.debug("  - radio_val is: %s", radio_val)
+        log.debug("  - custom_file_path is: %s", custom_file_path)
+        log.debug("  - switch_val is: %s", switch_val)
+        # The custom path is not used in auto mode, nothing to update
+        triggered = [t["prop_id"] for t in dash.callback_context.triggered]
+        if (radio_val == "Auto" and
+                triggered == ["group_select_folder_input.value"]):
+            raise PreventUpdate
         # Update database if necessary
-        global _DFLT_FIT_FILE_PATH, _CUR_FIT_FILES
-        global _FIT_FILE_LIST_FILTERED, _CUR_FIT_FILES
+        global _DFLT_FIT_FILE_PATH, _CUR_FIT_OPTS
         alert_style = {"display": "none"}
         alert_msg = ""
 
         if radio_val == "Auto":
-            _init_fit_file_db(_DFLT_FIT_FILE_PATH)
-            print("Using default FIT file path {}".format(_DFLT_FIT_FILE_PATH))
+            err = _init_fit_file_db(_DFLT_FIT_FILE_PATH)
+            log.debug("Using default FIT file path %s", _DFLT_FIT_FILE_PATH)
         else:
             if custom_file_path is None or not os.path.isdir(custom_file_path):
                 # 'Display' error by unhiding the alert box
@@ -200,29 +280,33 @@ def _init_callbacks(dash_app):
                 else:
                     alert_msg = "{} is not a valid folder".format(
                         custom_file_path)
-            _init_fit_file_db(custom_file_path)
-            print("Using custom FIT file path {}".format(custom_file_path))
+            err = _init_fit_file_db(custom_file_path)
+            log.debug("Using custom FIT file path %s", custom_file_path)
+        if err is not None:
+            alert_style = {"display": "block", "margin": "auto"}
+            alert_msg = "Can't read folder: {}".format(err)
+
+        # Prepare the most recent files of a newly selected folder
+        _warm_cache(dash_app.server,
+                    _FIT_FILE_LIST_FILTERED[:-_N_WARM_FILES - 1:-1])
 
         # Update list of fit files if necessary
         if switch_val:  # This is actually a check on len(list) > 0
-            _CUR_FIT_FILES = _FIT_FILE_LIST_FILTERED
+            _CUR_FIT_OPTS = _FIT_FILE_OPTS_FILTERED
             msg = "Select Dataset (non-empty)"
         else:
-            _CUR_FIT_FILES = _FIT_FILE_LIST
+            _CUR_FIT_OPTS = _FIT_FILE_OPTS
             msg = "Select Dataset (all)"
 
         # Update fit file selector dropwdown
-        opts = [{"label": os.path.basename(fname), "value": fname}
-                for fname in _CUR_FIT_FILES]
-        placeholder = os.path.basename(
-            _CUR_FIT_FILES[-1]) if _CUR_FIT_FILES else ""
-        value = _CUR_FIT_FILES[-1] if _CUR_FIT_FILES else None
-        print("  - placeholder is set to {}".format(placeholder))
-        print("  - value is set to {}".format(value))
+        # The options are prepared with the folder scan, just pick them
+        opts, placeholder, value = _dropdown_triple(_CUR_FIT_OPTS)
+        log.debug("  - placeholder is set to %s", placeholder)
+        log.debug("  - value is set to %s", value)
         return opts, placeholder, value, msg, alert_style, alert_msg
 
 
-def _init_fit_file_db(fit_db_path):
+def _init_fit_file_db(fit_db_path, min_size=_EMPTY_FIT_SIZE):
     """
     Search the given Zwift activity path for `*.fit` activity files.
 
@@ -230,32 +314,118 @@ def _init_fit_file_db(fit_db_path):
     ----------
     fit_db_path : str
         Fully resolved name where the `*.fit` files can be found.
-    """
-    global _FIT_FILE_LIST, _FIT_FILE_SIZES
-    global _FIT_FILE_LIST_FILTERED, _CUR_FIT_FILES
+    min_size : int, optional
+        Files up to this size in bytes are considered empty and are only
+        included in the full file list. (default: `_EMPTY_FIT_SIZE`)
 
-    _FIT_FILE_LIST, _FIT_FILE_LIST_FILTERED, _CUR_FIT_FILES = [], [], []
-    print("In _init_file_db")
+    Returns
+    -------
+    err : OSError or None
+        The error if the folder could not be read, then all lists are empty.
+    """
+    global _FIT_FILE_LIST, _FIT_FILE_OPTS
+    global _FIT_FILE_LIST_FILTERED, _FIT_FILE_OPTS_FILTERED
+    global _CUR_FIT_OPTS
+
+    _FIT_FILE_LIST, _FIT_FILE_LIST_FILTERED = [], []
+    _FIT_FILE_OPTS, _FIT_FILE_OPTS_FILTERED, _CUR_FIT_OPTS = [], [], []
+    log.debug("In _init_file_db")
+    err = None
     if fit_db_path is None:
-        print("No FIT DB path given")
+        log.debug("No FIT DB path given")
+    elif not os.path.isdir(fit_db_path):
+        log.debug("FIT DB path %s is not a folder", fit_db_path)
     else:
-        print("Looking for FIT files at {}".format(fit_db_path))
-        fit_files = sorted(glob(os.path.join(fit_db_path, "*.fit")))
-        _FIT_FILE_LIST = [f for f in fit_files
-                          if not os.path.basename(f).startswith("inProgress")]
-        _FIT_FILE_SIZES = [os.path.getsize(f) for f in fit_files]
+        # Adding, removing or renaming files changes the folder's mtime, so
+        # the last scan can be reused as long as it is unchanged
+        try:
+            (_FIT_FILE_LIST, _FIT_FILE_LIST_FILTERED,
+             _FIT_FILE_OPTS, _FIT_FILE_OPTS_FILTERED) = _scan_fit_file_db(
+                fit_db_path, os.stat(fit_db_path).st_mtime_ns, min_size)
+        except OSError as _err:
+            # Eg. no read permission, the folder is treated as empty
+            log.warning("Can't read FIT DB path %s: %s", fit_db_path, _err)
+            err = _err
         # Set filtered list to have non empty default
-        _CUR_FIT_FILES = _FIT_FILE_LIST_FILTERED = [
-            fname for fname, fs in zip(_FIT_FILE_LIST, _FIT_FILE_SIZES)
-            if fs > _EMPTY_FIT_SIZE
-        ]
-    print("Found {} FIT files".format(len(_FIT_FILE_LIST)))
-    print("Found {} non-empty FIT files".format(len(_CUR_FIT_FILES)))
+        _CUR_FIT_OPTS = _FIT_FILE_OPTS_FILTERED
+    log.debug("Found %d FIT files", len(_FIT_FILE_LIST))
+    log.debug("Found %d non-empty FIT files", len(_FIT_FILE_LIST_FILTERED))
+    return err
+
+
+def _dropdown_triple(opts):
+    """
+    Return the options, placeholder and value for the FIT file dropdown. The
+    most recent, last file is preselected.
+
+    Parameters
+    ----------
+    opts : list
+        Dropdown options as made by `_scan_fit_file_db`.
+
+    Returns
+    -------
+    opts : list
+        The given options.
+    placeholder : str
+        File name of the last option or an empty string if there is none.
+    value : str or None
+        Full name of the last option or `None` if there is none.
+    """
+    if not opts:
+        return opts, "", None
+    return opts, opts[-1]["label"], opts[-1]["value"]
+
+
+@functools.lru_cache(maxsize=8)
+def _scan_fit_file_db(fit_db_path, mtime_ns, min_size):
+    """
+    Search the given folder for `*.fit` activity files and make the dropdown
+    options for them. The folder's modification time is only used as cache
+    key. The returned lists are shared between calls and must not be modified.
+
+    Parameters
+    ----------
+    fit_db_path : str
+        Fully resolved name where the `*.fit` files can be found.
+    mtime_ns : int
+        Modification time of the folder in nanoseconds.
+    min_size : int
+        Files up to this size in bytes are considered empty.
+
+    Returns
+    -------
+    fit_files, fit_files_filtered : list
+        Sorted full names of all and of the non-empty FIT files.
+    fit_file_opts, fit_file_opts_filtered : list
+        Dropdown options with the file name as 'label' and the full name as
+        'value' for the files in `fit_files` and `fit_files_filtered`.
+    """
+    log.debug("Looking for FIT files at %s", fit_db_path)
+    fit_files, fit_files_filtered = [], []
+    fit_file_opts, fit_file_opts_filtered = [], []
+    # A single directory read, the entries cache their stat results. The full
+    # and the non-empty file lists are built in the same pass
+    with os.scandir(fit_db_path) as it:
+        for e in sorted(it, key=lambda e: e.name):
+            # The file type comes with the directory entry, no extra stat
+            if (not e.name.endswith(".fit") or e.name.startswith("inProgress")
+                    or not e.is_file()):
+                continue
+            # The name is the label, no need to split the path
+            opt = {"label": e.name, "value": e.path}
+            fit_files.append(e.path)
+            fit_file_opts.append(opt)
+            if e.stat().st_size > min_size:
+                fit_files_filtered.append(e.path)
+                fit_file_opts_filtered.append(opt)
+    return (fit_files, fit_files_filtered,
+            fit_file_opts, fit_file_opts_filtered)
 
 
 def _load_fit_file(fname):
     """
-    Returns values as `name: list of values` pairs and dict of `name: unit name`
+    Returns values as `name: array of values` pairs and dict of `name: unit name`
     for the FIT file with the given filename.
 
     Parameters
@@ -266,28 +436,39 @@ def _load_fit_file(fname):
     Returns
     -------
     values : dict
-        Dictionary with parameter names as keys and a list of all values stored
-        in the fit file.
+        Dictionary with parameter names as keys and an array of all values
+        stored in the fit file.
     units : dict
         Dictionary with parameter names as keys and unit names as values. Has
         same keys as `values`.
     """
-    print("In _load_fit_file")
-    print(fname)
-    values, units, sets_of_names = {}, {}, {}
+    log.debug("In _load_fit_file")
+    log.debug(fname)
+    values, units, buffered_rows, field_units = {}, {}, {}, {}
     if fname is None:
         return values, units
 
+    if not os.path.isfile(fname):
+        raise IOError("No FIT file found at {}".format(fname))
+
+    # Only needed when a file is actually opened, so import it here and keep
+    # it out of the app start up
+    import fitdecode
+
     try:
-        with fitdecode.FitReader(fname) as fit:
+        # The files are local and only read, checking CRCs would mean another
+        # pass over all bytes. Defective files still fail in the decoder
+        with fitdecode.FitReader(
+                fname, check_crc=fitdecode.CrcCheck.DISABLED) as fit:
             # The yielded frame object is of one of the following types:
             # * fitdecode.FitHeader
             # * fitdecode.FitDefinitionMessage
             # * fitdecode.FitDataMessage
             # * fitdecode.FitCRC
-            # Make a first pass checking the longest set of attributes over all
-            # records. Then use only those frames with all of the attrs in a
-            # second run to have consistent array data.
+            # Make a single pass and buffer all records grouped by their
+            # attribute names. The field order is fixed by the definition
+            # message, so the names tuple is a cheap key. Then use only the
+            # rows of the most common names to have consistent array data.
             for frame in fit:
                 # We only want the data frames
                 if not isinstance(frame, fitdecode.FitDataMessage):
@@ -295,94 +476,274 @@ def _load_fit_file(fname):
 
                 # The record frames contain the wanted data columns
                 if frame.name == "record":
-                    _values = [f.value for f in frame.fields]
-                    _names = [f.name for i, f in enumerate(frame.fields)
-                              if _values[i] is not None]
-                    key = frozenset(_names)
-                    if key not in sets_of_names:
-                        sets_of_names[key] = 0
-                    sets_of_names[key] += 1
-
-        most_common_set_of_names = max(sets_of_names, key=sets_of_names.get)
-        print("FIT file most common set of data field names: {}".format(
-            ", ".join(sorted(most_common_set_of_names))))
-
-        with fitdecode.FitReader(fname) as fit:
-            for frame in fit:
-                if not isinstance(frame, fitdecode.FitDataMessage):
-                    continue
-
-                if frame.name == "record":
-                    # Append data to collection.
-                    # Note: Some seem to be doubled but None? Ignore them
-                    _values = [f.value for f in frame.fields]
-                    _names = [f.name for i, f in enumerate(frame.fields)
-                              if _values[i] is not None]
-                    if frozenset(_names) != most_common_set_of_names:
-                        print("Ignoring frame with names {}".format(
-                            ", ".join(sorted(_names))))
-                        continue  # Ignore incompatible frames
-                    _units = [f.units for i, f in enumerate(frame.fields)
-                              if _values[i] is not None]
-                    _values = [
-                        f.value for f in frame.fields if f.value is not None]
-                    # Init
-                    if not values:
-                        values = {name: [] for name in _names}
-                        units = {
-                            name: unit for name, unit in zip(_names, _units)}
-                    # Check consistency
-                    if (len(_names) != len(values)
-                            or not all([n in values for n in _names])):
-                        print(_names)
-                        print(_values)
-                        print(_units)
-                        raise ValueError("Inconsistent columns in FIT records.")
-                    # Store
-                    for n, v in zip(_names, _values):
-                        values[n].append(v)
+                    # Note: Some seem to be doubled but None? Ignore them.
+                    # Single pass over the fields, then unzip to columns
+                    fields = [(f.name, f.value, f.units) for f in frame.fields
+                              if f.value is not None]
+                    if not fields:
+                        continue
+                    _names, _values, _units = zip(*fields)
+                    # Names and units are the same for all rows of a key.
+                    # Only a single dict lookup for already known keys
+                    rows = buffered_rows.get(_names)
+                    if rows is None:
+                        rows = buffered_rows[_names] = []
+                        field_units[_names] = _units
+                    rows.append(_values)
                 elif frame.name == "session":
                     # This contains ride summaries and potentially integer
                     # encoded course and world name. Currently not used
                     continue
 
+        names = max(buffered_rows, key=lambda key: len(buffered_rows[key]))
+        log.debug("FIT file most common set of data field names: %s",
+                  ", ".join(sorted(names)))
+        for key, rows in buffered_rows.items():
+            if key != names:
+                log.debug("Ignoring %d frames with names %s",
+                          len(rows), ", ".join(sorted(key)))
+        # Check consistency
+        if len(set(names)) != len(names):
+            log.debug(names)
+            raise ValueError("Inconsistent columns in FIT records.")
+
+        # All rows have the same field order, so transpose them to columns.
+        # The number of rows is known, so each array is allocated only once
+        rows = buffered_rows[names]
+        units = {name: unit for name, unit in zip(names, field_units[names])}
+        for name, column in zip(names, zip(*rows)):
+            dtype = _infer_dtype(column[0], units[name])
+            items = column
+            if isinstance(column[0], datetime.datetime):
+                # FIT timestamps are UTC. numpy only takes naive ones without
+                # a warning, so drop the tzinfo after converting to UTC
+                items = (d.astimezone(datetime.timezone.utc).replace(
+                    tzinfo=None) if getattr(d, "tzinfo", None) else d
+                    for d in column)
+            try:
+                values[name] = np.fromiter(items, dtype=dtype,
+                                           count=len(rows))
+            except (ValueError, TypeError):
+                # The type is only inferred from the first value, eg. enum
+                # fields are names for known and ints for unknown values
+                log.debug("Mixed value types in %s, stored as objects", name)
+                values[name] = np.fromiter(column, dtype=object,
+                                           count=len(rows))
+
     except Exception as err:
         raise IOError("Invalid FIT file entries: {}".format(err))
 
-    # Enhance with a normalized distance and time fields
+    # Enhance with a normalized distance and time fields. Each derived field
+    # is computed in one vectorized step on the converted column
     if "altitude" in values:
-        values["altitude_norm"] = [
-            d - values["altitude"][0] for d in values["altitude"]]
+        alt = np.asarray(values["altitude"], dtype=np.float32)
+        values["altitude_norm"] = alt - alt[0]
         units["altitude_norm"] = units["altitude"]
-    # This breaks if days are involved...
+    # Total seconds since start, also correct if days are involved
     if "timestamp" in values:
-        values["time_norm"] = [
-            (d - values["timestamp"][0]).seconds for d in values["timestamp"]]
+        ts = values["timestamp"]
+        values["time_norm"] = (ts - ts[0]).astype(np.int64)
         units["time_norm"] = "s"
     if "speed" in values:
-        values["speed_kmh"] = [d * 3.6 for d in values["speed"]]
+        values["speed_kmh"] = np.asarray(values["speed"], dtype=np.float32) * 3.6
         units["speed_kmh"] = "km/h"
     # Convert from semicircles to degrees
     if "position_long" in values:
-        values["pos_lon_deg"] = [
-            d * (180. / 2**31) for d in values["position_long"]]
+        values["pos_lon_deg"] = np.asarray(
+            values["position_long"], dtype=np.int32) * (180. / 2**31)
         units["pos_lon_deg"] = "degree"
     if "position_lat" in values:
-        values["pos_lat_deg"] = [
-            d * (180. / 2**31) for d in values["position_lat"]]
+        values["pos_lat_deg"] = np.asarray(
+            values["position_lat"], dtype=np.int32) * (180. / 2**31)
         units["pos_lat_deg"] = "degree"
 
     return values, units
 
 
+@functools.lru_cache(maxsize=4)
+def _load_fit_file_cached(fname, mtime_ns, size):
+    """
+    Cached version of `_load_fit_file`. The modification time and size of the
+    file are only used as cache key, so a changed file gets parsed again.
+    The last few files are kept in memory, all others are read from the disk
+    cache `_CACHE`, which needs an app context. The returned dicts are shared
+    between calls and must not be modified.
+    """
+    return _load_fit_file_locked(fname, mtime_ns, size)
+
+
+def _load_fit_file_locked(fname, mtime_ns, size):
+    """
+    Load a FIT file through the disk cache `_CACHE` only, see
+    `_load_fit_file_cached`. Concurrent loads of the same file, eg. by
+    `_warm_cache`, wait for the first one and then get its result from the
+    cache.
+    """
+    with _PARSE_LOCKS.setdefault(fname, threading.Lock()):
+        return _load_fit_file_memoized(fname, mtime_ns, size)
+
+
+@_CACHE.memoize(timeout=0)
+def _load_fit_file_memoized(fname, mtime_ns, size):
+    """
+    Version of `_load_fit_file` memoized in `_CACHE`, see
+    `_load_fit_file_cached`.
+    """
+    return _load_fit_file(fname)
+
+
+def _load_fit_file_bulk(fnames):
+    """
+    Load the given FIT files through the disk cache `_CACHE`, skipping files
+    that can't be read or failed to parse before. The in-memory cache is left
+    alone, so bulk loads don't evict the files currently shown. Needs an app
+    context for `_CACHE`.
+
+    Parameters
+    ----------
+    fnames : list
+        Fully resolved filenames of the FIT files to load, in this order.
+
+    Returns
+    -------
+    loaded : dict
+        Dictionary with the filenames as keys and the `values, units` tuples
+        from `_load_fit_file` as values for all readable files.
+    """
+    loaded = {}
+    # Parsing is mostly Python code holding the GIL, so a thread pool would
+    # not be faster. The files are loaded one after the other
+    for fname in fnames:
+        try:
+            st = os.stat(fname)
+        except IOError as err:
+            log.debug("Skipping %s: %s", fname, err)
+            continue
+        key = (fname, st.st_mtime_ns, st.st_size)
+        if key in _FAILED_FILES:
+            continue
+        try:
+            loaded[fname] = _load_fit_file_locked(*key)
+        except IOError as err:
+            _FAILED_FILES.add(key)
+            log.debug("Skipping %s: %s", fname, err)
+    return loaded
+
+
+def _warm_cache(server, fnames):
+    """
+    Parse the given FIT files into `_CACHE` in a background thread, so that
+    selecting them later is only a cache lookup. Files already in the cache
+    are skipped by the memoization, repeated calls with the same files are
+    ignored. A new call replaces the files of an unfinished one, so switching
+    folders doesn't pile up parsing work.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        Flask app `_CACHE` is bound to.
+    fnames : list
+        Fully resolved filenames of the FIT files to load, in this order.
+    """
+    global _LAST_WARMED, _WARM_PENDING, _WARM_THREAD
+    fnames = tuple(fnames)
+    with _WARM_COND:
+        if not fnames or fnames == _LAST_WARMED:
+            return
+        _LAST_WARMED = _WARM_PENDING = fnames
+        if _WARM_THREAD is None:
+            _WARM_THREAD = threading.Thread(
+                target=_warm_worker, args=(server,), daemon=True)
+            _WARM_THREAD.start()
+        _WARM_COND.notify()
+
+
+def _warm_worker(server):
+    """
+    Loop of the `_warm_cache` thread. Loads the pending files one by one and
+    stops early, when newer files are pending.
+    """
+    global _WARM_PENDING
+    with server.app_context():
+        while True:
+            with _WARM_COND:
+                while not _WARM_PENDING:
+                    _WARM_COND.wait()
+                fnames, _WARM_PENDING = _WARM_PENDING, ()
+            n_loaded = 0
+            for fname in fnames:
+                if _WARM_PENDING:
+                    log.debug("Dropping stale warm-up")
+                    break
+                n_loaded += len(_load_fit_file_bulk([fname]))
+            log.debug("Cached %d FIT files in the background", n_loaded)
+
+
+def _infer_dtype(value, unit=None):
+    """
+    Return the `numpy` dtype to store values of the same type and unit as the
+    given FIT record field value. Timestamps are stored as `numpy.datetime64`,
+    positions in their raw semicircle encoding as `numpy.int32`, all other
+    numbers as `numpy.float32` and everything else as objects.
+    """
+    if isinstance(value, datetime.datetime):
+        return "datetime64[s]"
+    if unit == "semicircles":
+        return np.int32
+    if isinstance(value, numbers.Real):
+        # Plenty for sensor data and half the memory and plot payload
+        return np.float32
+    return object
+
+
+@functools.lru_cache(maxsize=32)
+def _make_figure_cached(fname, mtime_ns, size, ynames, xrnge):
+    """
+    Cached version of `_make_figure` for the given FIT file, see
+    `_load_fit_file_cached` for the file arguments. `ynames` and `xrnge` must
+    be given as tuples. The mean lines are always included, they are toggled
+    in the browser. The returned figure is shared between calls and must not
+    be modified.
+    """
+    values, units = _load_fit_file_cached(fname, mtime_ns, size)
+    fig = _make_figure(values, units, ynames=list(ynames), xrnge=list(xrnge),
+                       plot_means=True,
+                       cumsums=_prefix_sums_cached(fname, mtime_ns, size))
+    # Keep user zoom state on updates until another file is selected
+    fig.update_layout(uirevision=fname)
+    return fig
+
+
+@functools.lru_cache(maxsize=4)
+def _prefix_sums_cached(fname, mtime_ns, size):
+    """
+    Cached version of `_prefix_sums` for the given FIT file, see
+    `_load_fit_file_cached`. Computed once per file, so the means for each new
+    x range are only a difference. The returned dict is shared between calls
+    and must not be modified.
+    """
+    values, _ = _load_fit_file_cached(fname, mtime_ns, size)
+    return _prefix_sums(values)
+
+
+def _prefix_sums(values):
+    """
+    Return the prefix sums with a leading zero for all numeric columns in
+    `values`. The mean of `values[name][i:j]` is then
+    `(cumsums[name][j] - cumsums[name][i]) / (j - i)`.
+    """
+    return {name: np.concatenate(([0.], np.cumsum(arr, dtype=float)))
+            for name, arr in values.items() if arr.dtype.kind in "fiu"}
+
+
 def _make_figure(values, units, ynames=["power"],
-                 xrnge=[None, None], plot_means=True):
+                 xrnge=[None, None], plot_means=True, cumsums=None):
     fig = go.Figure()
 
-    print("In _make_figure")
-    print("ynames", ynames)
-    print("xrnge", xrnge)
-    print("plot_means", plot_means)
+    log.debug("In _make_figure")
+    log.debug("ynames %s", ynames)
+    log.debug("xrnge %s", xrnge)
+    log.debug("plot_means %s", plot_means)
 
     if values:
         ax_colors = {
@@ -393,46 +754,76 @@ def _make_figure(values, units, ynames=["power"],
             "heart_rate": "#2ca02c",
             }
         # Time in minutes
-        times = np.array(values["time_norm"]) / 60.
-
-        # Slice it?
-        idx0, idx1 = 0, -1
+        times = values["time_norm"] / 60.
+
+        # Select the range for the mean values and the finer downsampling of
+        # the zoomed range. The traces only hold downsampled data, the browser
+        # zooms into them right away and the server rebuilds the figure for
+        # the new range afterwards.
+        # The times are sorted, so the range edges can be found by bisection
+        idx0, idx1 = 0, len(times)
         if xrnge[0] is not None:
-            idx0 = np.where(times > xrnge[0])[0][0]
+            idx0 = np.searchsorted(times, xrnge[0], side="right")
         if xrnge[1] is not None:
-            idx1 = np.where(times < xrnge[1])[0][-1]
-        times = times[idx0:idx1]
+            idx1 = np.searchsorted(times, xrnge[1], side="left")
+        # Edges of the mean lines are the same for all names
+        has_sel = idx1 > idx0
+        if has_sel:
+            t0, tN = times[idx0], times[idx1 - 1]
 
         # We need to make room for all the potential extra axes
         _offset = 0.1
         _offsets = [1. - j * _offset for j in range(len(ynames) - 2, 0, -1)]
         domain_cuts = max(0, (len(ynames) - 1) * _offset)
 
+        if plot_means and cumsums is None:
+            cumsums = _prefix_sums({name: values[name] for name in ynames})
+
         # Plot each name's data set
         _title = []
         yaxes_props = {}
         for i, name in enumerate(ynames):
             # First value is drawn to the left main axis, all others are getting
             # a new axis on the right. The names are tight implicitely by plotly
-            _ax_id = "y" if i == 0 else "y{}".format(i + 1)
-            _ax_name = "yaxis" if i == 0 else "yaxis{}".format(i + 1)
-
-            print("Plot {} on axis {} ({}, {})".format(name, i, _ax_id, _ax_name))
-            fig.add_trace(go.Scatter(
-                x=times, y=values[name][idx0:idx1], yaxis=_ax_id,
+            _ax_id, _ax_name = _AX_IDS[i], _AX_NAMES[i]
+
+            log.debug("Plot %s on axis %d (%s, %s)", name, i, _ax_id, _ax_name)
+            # WebGL renders long traces much faster than SVG. The two point
+            # mean lines below are fine as SVG
+            y = values[name]
+            idx = np.arange(len(times))
+            if len(times) > 3 * _N_PLOT_SAMPLES:
+                idx = _downsample(times, y, _N_PLOT_SAMPLES)
+                if idx1 - idx0 < len(times):
+                    # Keep the points for the full range and add a finer
+                    # selection of the zoomed range, so zooming out in the
+                    # browser still has the whole curve
+                    idx = np.union1d(idx, idx0 + _downsample(
+                        times[idx0:idx1], y[idx0:idx1], _N_PLOT_SAMPLES))
+            # Pass float32 arrays, plotly serializes them without per element
+            # conversion (as typed arrays in newer versions, with orjson if
+            # installed) and the payload is halved
+            fig.add_trace(go.Scattergl(
+                x=times[idx].astype(np.float32),
+                y=y[idx].astype(np.float32),
+                yaxis=_ax_id,
                 name=name,
                 line={"color": ax_colors[name]}, showlegend=False,
                 mode="lines",
             ))
 
-            if plot_means:
-                _mean = np.mean(values[name][idx0:idx1])
+            if plot_means and has_sel:
+                cs = cumsums[name]
+                _mean = (cs[idx1] - cs[idx0]) / (idx1 - idx0)
+                # The clientside range update finds the mean traces by `meta`,
+                # each one directly follows the data trace it belongs to
                 fig.add_trace(go.Scatter(
-                    x=[times[0], times[-1]], y=2 * [_mean],
+                    x=[t0, tN], y=2 * [_mean],
                     yaxis=_ax_id, name=name,
                     line={"color": ax_colors[name], "dash": "dash"},
                     mode="lines",
                     showlegend=False,
+                    meta="mean",
                 ))
                 _title.append("{}={:.1f}".format(name, _mean))
 
@@ -454,8 +845,8 @@ def _make_figure(values, units, ynames=["power"],
                 name, units[name])
 
         # Create axis objects
-        print("Domain cut: ", [0, 1 - domain_cuts])
-        print(yaxes_props)
+        log.debug("Domain cut: %s", [0, 1 - domain_cuts])
+        log.debug(yaxes_props)
         fig.update_layout(
             xaxis={"title": "Time in s", "domain": [0, 1 - domain_cuts]},
             **yaxes_props,
@@ -471,15 +862,63 @@ def _make_figure(values, units, ynames=["power"],
     return fig
 
 
+def _downsample(x, y, n_target):
+    """
+    Select `n_target` points of the curve `x, y` with the Largest-Triangle-
+    Three-Buckets algorithm, which keeps the visual shape of the curve.
+
+    Parameters
+    ----------
+    x, y : array-like
+        Coordinates of the curve, `x` must be sorted.
+    n_target : int
+        Number of points to select.
+
+    Returns
+    -------
+    idx : array
+        Sorted indices of the selected points.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= n_target or n_target < 3:
+        return np.arange(n)
+
+    # First and last point are always kept, the others are split into buckets
+    # from which one point is selected each
+    edges = np.linspace(1, n - 1, n_target - 1).astype(int)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    # The last bucket is compared against the last point
+    mean_x = np.append(mean_x[1:], x[-1])
+    mean_y = np.append(mean_y[1:], y[-1])
+
+    idx = np.empty(n_target, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i, (lo, hi) in enumerate(zip(edges[:-1], edges[1:])):
+        # Take the point spanning the largest triangle with the last selected
+        # point and the mean point of the next bucket
+        area = np.abs((x[a] - mean_x[i]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (mean_y[i] - y[a]))
+        a = lo + np.argmax(area)
+        idx[i + 1] = a
+
+    return idx
+
+
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.DEBUG)
     dash_app = dash.Dash(
         external_stylesheets=[dbc.themes.MINTY],
     )
+    _CACHE.init_app(dash_app.server, config=_CACHE_CONFIG)
 
     _init_fit_file_db(_DFLT_FIT_FILE_PATH)
     _init_layout(dash_app)
     _init_callbacks(dash_app)
 
-    print("Dash app created")
+    log.info("Dash app created")
 
     dash_app.run_server(debug=True)
@@ -2,8 +2,6 @@
 Outsourced UI element blobs.
 """
 
-import os
-
 import dash_bootstrap_components as dbc
 from dash import dcc
 from dash import html
@@ -32,7 +30,9 @@ def get_ui_card_form_group_select_folder(id_pref):
             dbc.Input(
                 id=id_pref + "input",
                 placeholder="Enter custom path",
-                type="text"
+                type="text",
+                # Only update on enter or losing focus, not on every key
+                debounce=True,
             ),
             # Hidden, except users enter invalid path, then it show with err msg
             html.Div(
@@ -48,7 +48,8 @@ def get_ui_card_form_group_select_folder(id_pref):
     )
 
 
-def get_ui_card_form_group_select_fit_file(id_pref, fit_files):
+def get_ui_card_form_group_select_fit_file(id_pref, fit_file_opts,
+                                           placeholder="", value=None):
     """
     Return a `dash_bootstrap_components.Card` with a `dash_bootstrap_components`
     form group including a text label, dropwdown list and a checklist and
@@ -56,17 +57,19 @@ def get_ui_card_form_group_select_fit_file(id_pref, fit_files):
     These can be accessed using the created ids 'label', 'dropdown',
     'checklist', 'div' each prepended with `id_pref`.
 
-    `fit_files` is a list of default list items to show in the dropwdown menu.
+    `fit_file_opts` is a list of default dropdown options, given as dicts with
+    the file name as 'label' and the full path as 'value'. `placeholder` and
+    `value` are the initial placeholder and selected value of the dropdown.
     """
     return dbc.Card(
         [
-            dbc.Label("Select Dataset", id=id_pref + "label"),
+            # Matches the default state of the checklist below
+            dbc.Label("Select Dataset (non-empty)", id=id_pref + "label"),
             dcc.Dropdown(
                 id=id_pref + "dropdown",
-                options=[{"label": os.path.basename(fname), "value": fname}
-                         for fname in fit_files],
-                placeholder=os.path.basename(fit_files[-1]) if fit_files else "",
-                value=fit_files[-1] if fit_files else None,
+                options=fit_file_opts,
+                placeholder=placeholder,
+                value=value,
             ),
             html.Br(),
             dbc.Checklist(
@@ -128,12 +131,13 @@ def get_ui_card_form_group_graph_data_selector(id_pref):
 def get_ui_graph_main(id_pref):
     """
     Return a `dash_html_components.Div` with two inner
-    `dash_html_components.Div`.
+    `dash_html_components.Div` and a `dash_core_components.Store`.
     The first div holds a `dash_html_components.Graph`, the second one a
     `dash_bootstrap_components.Alert` box which is hidden by default
-    (`style={"display": "none"}`).
+    (`style={"display": "none"}`). The store holds the full figure, which is
+    shown in the graph in the currently selected range.
     These can be accessed using the created ids 'graph', 'alert', 'div_graph',
-    'div_alert' and 'div'.
+    'div_alert', 'store' and 'div'.
     """
     # Main graph showing the loaded FIT file, centered below card row.
     # The divs are switched on/off via the style element. Instead of the graph,
@@ -166,6 +170,7 @@ def get_ui_graph_main(id_pref):
                 id=id_pref + "div_alert",
                 style={"display": "none"}
             ),
+            dcc.Store(id=id_pref + "store"),
         ],
         id=id_pref + "div"
     )
@@ -8,4 +8,5 @@ export FLASK_APP=fitboard:init_app
 export FLASK_ENV=development
 export FLASK_DEBUG=1
 export DASH_DEBUG=1
+export FITBOARD_DEBUG=1
 poetry run flask run --port 8888